@@ -8,11 +8,9 @@ from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
-from einops import rearrange, repeat
 
 from fla.modules import FusedRMSNormSwishGate, RMSNorm, ShortConvolution
-from fla.modules.activations import ACT2FN
+from fla.modules.activations import ACT2FN, logsigmoid, swiglu, swish
 from fla.ops.gla import chunk_gla, fused_chunk_gla, fused_recurrent_gla
 
 if TYPE_CHECKING:
@@ -63,7 +61,8 @@ class GatedLinearAttention(nn.Module):
         clamp_min (float, Optional):
             The minimum value for the gate logits. Default: None.
         fuse_norm (bool, Optional):
-            Whether to fuse the norm and the output gate for better memory footprint. Default: `True`.
+            Whether to fuse the norm and the output gate for better memory footprint.
+            Only takes effect for `swish`/`silu` gates. Default: `True`.
         layer_idx (int, Optional):
             The index of the layer. Default: None.
     """
@@ -114,15 +113,19 @@ class GatedLinearAttention(nn.Module):
         self.layer_idx = layer_idx
 
         assert mode in ['chunk', 'fused_recurrent', 'fused_chunk'], f"Not suppoerted mode `{mode}`."
+        # bind the kernel once here rather than dispatching on `mode` in every forward call
+        self.kernel = {'chunk': chunk_gla, 'fused_chunk': fused_chunk_gla, 'fused_recurrent': fused_recurrent_gla}[mode]
         assert self.key_dim % num_heads == 0, f"key dim must be divisible by num_heads of {num_heads}"
         assert self.value_dim % num_heads == 0, f"value dim must be divisible by num_heads of {num_heads}"
 
         self.head_qk_dim = self.key_dim // num_heads
         self.head_v_dim = self.value_dim // num_heads
 
-        self.q_proj = nn.Linear(hidden_size, self.key_dim, bias=False)
-        self.k_proj = nn.Linear(hidden_size, self.key_dim_per_group, bias=False)
-        self.v_proj = nn.Linear(hidden_size, self.value_dim_per_group, bias=False)
+        # q/k/v and the low-rank gate projection all read `hidden_states`,
+        # so we fuse them into a single GEMM and split the outputs afterwards
+        self.qkvg_dims = [self.key_dim, self.key_dim_per_group, self.value_dim_per_group, gate_low_rank_dim]
+        self.qkvg_proj = nn.Linear(hidden_size, sum(self.qkvg_dims), bias=False)
+        self.gk_up = nn.Linear(gate_low_rank_dim, self.key_dim_per_group, bias=True)
         if self.use_output_gate:
             self.g_proj = nn.Linear(hidden_size, self.value_dim, bias=False)
 
@@ -132,11 +135,10 @@ class GatedLinearAttention(nn.Module):
             self.k_conv1d = ShortConvolution(self.key_dim_per_group, conv_size, activation='silu')
             self.v_conv1d = ShortConvolution(self.value_dim_per_group, conv_size, activation='silu')
 
-        self.gk_proj = nn.Sequential(nn.Linear(hidden_size, gate_low_rank_dim, bias=False),
-                                     nn.Linear(gate_low_rank_dim, self.key_dim_per_group, bias=True))
         self.o_proj = nn.Linear(self.value_dim, hidden_size, bias=False)
 
-        if gate_fn == 'swish' and fuse_norm and use_output_gate:
+        # `silu` is the same activation as `swish`, so both can take the fused norm-gate kernel
+        if gate_fn in ('swish', 'silu') and fuse_norm and use_output_gate:
             self.g_norm_swish_gate = FusedRMSNormSwishGate(self.head_v_dim, elementwise_affine, norm_eps)
             self.fuse_norm_and_gate = True
         else:
@@ -147,16 +149,34 @@ class GatedLinearAttention(nn.Module):
         self.gate_logit_normalizer = gate_logit_normalizer
 
         self.apply(self._initialize_weights)
+        self._register_load_state_dict_pre_hook(self.load_hook)
 
     def _initialize_weights(self, module: nn.Module):
         if getattr(module, "_is_hf_initialized", False):
             return
         if isinstance(module, nn.Linear):
-            nn.init.xavier_uniform_(module.weight, gain=2 ** -2.5)
+            # the fused projection is initialized slice by slice to keep the fan-in/fan-out of each sub-projection
+            weights = module.weight.split(self.qkvg_dims) if module is self.qkvg_proj else (module.weight,)
+            for weight in weights:
+                nn.init.xavier_uniform_(weight, gain=2 ** -2.5)
             if module.bias is not None:
                 nn.init.zeros_(module.bias)
         module._is_hf_initialized = True
 
+    def load_hook(self, state_dict, prefix, *args):
+        # convert checkpoints with separate `q_proj`/`k_proj`/`v_proj`/`gk_proj` to the fused layout
+        keys = [f'{prefix}{name}.weight' for name in ('q_proj', 'k_proj', 'v_proj', 'gk_proj.0')]
+        found = [key in state_dict for key in keys]
+        if all(found):
+            state_dict[f'{prefix}qkvg_proj.weight'] = torch.cat([state_dict.pop(key) for key in keys])
+        elif any(found):
+            # a partial legacy checkpoint would otherwise silently leave `qkvg_proj` randomly initialized
+            missing = [key for key, exists in zip(keys, found) if not exists]
+            raise ValueError(f"Incomplete legacy GLA checkpoint: missing {missing} to build `{prefix}qkvg_proj.weight`.")
+        for name in ('weight', 'bias'):
+            if f'{prefix}gk_proj.1.{name}' in state_dict:
+                state_dict[f'{prefix}gk_up.{name}'] = state_dict.pop(f'{prefix}gk_proj.1.{name}')
+
     def forward(
         self,
         hidden_states: torch.Tensor,
@@ -173,110 +193,90 @@ class GatedLinearAttention(nn.Module):
                 "Arbitrary attention masks of shape [batch_size, seq_len, seq_len] are not allowed."
             )
 
+        batch_size, q_len = hidden_states.shape[:2]
         # launching the triton kernel for just one token will actually be slower
-        mode = 'fused_recurrent' if hidden_states.shape[1] <= 64 else self.mode
+        kernel = fused_recurrent_gla if q_len <= 64 else self.kernel
 
+        # final states are only worth computing if there is a cache to store them in
+        use_cache = use_cache and past_key_values is not None
         last_state = None
         if past_key_values is not None and len(past_key_values) > self.layer_idx:
             last_state = past_key_values[self.layer_idx]
+        q, k, v, gk = self.qkvg_proj(hidden_states).split(self.qkvg_dims, -1)
         if self.use_short_conv:
             conv_state_q, conv_state_k, conv_state_v = None, None, None
             if last_state is not None:
                 conv_state_q, conv_state_k, conv_state_v = last_state['conv_state']
-            conv_mask = attention_mask[:, -hidden_states.shape[1]:] if attention_mask is not None else None
+            conv_mask = attention_mask[:, -q_len:] if attention_mask is not None else None
             position_ids = kwargs.get('position_ids', None)
-            q, conv_state_q = self.q_conv1d(x=self.q_proj(hidden_states),
+            q, conv_state_q = self.q_conv1d(x=q,
                                             mask=conv_mask,
                                             cache=conv_state_q,
                                             output_final_state=use_cache,
                                             seq_idx=position_ids)
-            k, conv_state_k = self.k_conv1d(x=self.k_proj(hidden_states),
+            k, conv_state_k = self.k_conv1d(x=k,
                                             mask=conv_mask,
                                             cache=conv_state_k,
                                             output_final_state=use_cache,
                                             seq_idx=position_ids)
-            v, conv_state_v = self.v_conv1d(x=self.v_proj(hidden_states),
+            v, conv_state_v = self.v_conv1d(x=v,
                                             mask=conv_mask,
                                             cache=conv_state_v,
                                             output_final_state=use_cache,
                                             seq_idx=position_ids)
-        else:
-            q = self.q_proj(hidden_states)
-            k = self.k_proj(hidden_states)
-            v = self.v_proj(hidden_states)
-        gk = self.gk_proj(hidden_states)
+        # logsigmoid, normalization and clamping are fused into one elementwise kernel,
+        # applied before the kv-group expansion to touch as few elements as possible
+        gk = logsigmoid(self.gk_up(gk), self.gate_logit_normalizer, self.clamp_min)
 
         if self.feature_map_fn is not None:
             q, k = map(self.feature_map_fn, (q, k))
         # dealing with left-padding
         if attention_mask is not None:
-            v = v.mul_(attention_mask[:, -v.shape[-2]:, None])
-        q = rearrange(q, 'b t (h d) -> b t h d', h=self.num_heads)
+            v = v * attention_mask[:, -q_len:, None]
+        # plain stride manipulations are much cheaper than einops patterns on the decoding path
+        q = q.view(batch_size, q_len, self.num_heads, -1)
         if self.num_kv_groups > 1:
-            k, v, gk = (repeat(x, 'b t (h d) -> b t (h g) d', h=self.num_kv_heads, g=self.num_kv_groups) for x in (k, v, gk))
+            k, v, gk = (
+                x.view(batch_size, q_len, self.num_kv_heads, 1, -1)
+                 .expand(-1, -1, -1, self.num_kv_groups, -1)
+                 .reshape(batch_size, q_len, self.num_heads, -1)
+                for x in (k, v, gk)
+            )
         else:
-            k, v, gk = (rearrange(x, 'b t (h d) -> b t h d', h=self.num_kv_heads) for x in (k, v, gk))
-        gk = F.logsigmoid(gk) / self.gate_logit_normalizer
-
-        if self.clamp_min is not None:
-            gk = torch.clamp_min(gk, self.clamp_min)
+            k, v, gk = (x.view(batch_size, q_len, self.num_kv_heads, -1) for x in (k, v, gk))
 
         recurrent_state = last_state['recurrent_state'] if last_state is not None else None
         cu_seqlens = kwargs.get('cu_seqlens', None)
-        if mode == 'fused_recurrent':
-            o, recurrent_state = fused_recurrent_gla(
-                q=q,
-                k=k,
-                v=v,
-                gk=gk,
-                initial_state=recurrent_state,
-                output_final_state=use_cache,
-                cu_seqlens=cu_seqlens,
-                head_first=False
-            )
-        elif mode == 'fused_chunk':
-            o, recurrent_state = fused_chunk_gla(
-                q=q,
-                k=k,
-                v=v,
-                g=gk,
-                initial_state=recurrent_state,
-                output_final_state=use_cache,
-                head_first=False
-            )
-        elif mode == 'chunk':
-            o, recurrent_state = chunk_gla(
-                q=q,
-                k=k,
-                v=v,
-                g=gk,
-                initial_state=recurrent_state,
-                output_final_state=use_cache,
-                cu_seqlens=cu_seqlens,
-                head_first=False
-            )
-        else:
-            raise NotImplementedError(f"Not supported mode `{mode}`.")
-
-        if past_key_values is not None:
+        o, recurrent_state = kernel(
+            q,
+            k,
+            v,
+            gk,
+            initial_state=recurrent_state,
+            output_final_state=use_cache,
+            cu_seqlens=cu_seqlens,
+            head_first=False
+        )
+
+        if use_cache:
             past_key_values.update(
                 recurrent_state=recurrent_state,
                 conv_state=(conv_state_q, conv_state_k, conv_state_v) if self.use_short_conv else None,
                 layer_idx=self.layer_idx,
-                offset=q.shape[1]
+                offset=q_len
             )
 
         if self.use_output_gate:
             g = self.g_proj(hidden_states)
             if self.fuse_norm_and_gate:
-                g = rearrange(g, 'b t (h d) -> b t h d', h=self.num_heads)
-                o = self.g_norm_swish_gate(o, g)
-                o = rearrange(o, 'b t h d -> b t (h d)')
+                o = self.g_norm_swish_gate(o, g.view(batch_size, q_len, self.num_heads, -1))
+                o = o.reshape(batch_size, q_len, -1)
             else:
-                o = rearrange(self.g_norm(o), 'b t h d -> b t (h d)')
-                o = o * self.gate_fn(g)
+                o = self.g_norm(o).reshape(batch_size, q_len, -1)
+                # swish gates are applied with a single activation-and-multiply kernel
+                o = swiglu(g, o) if self.gate_fn is swish else o * self.gate_fn(g)
         else:
-            o = rearrange(self.g_norm(o), 'b t h d -> b t (h d)')
+            o = self.g_norm(o).reshape(batch_size, q_len, -1)
         o = self.o_proj(o)
 
         return o, None, past_key_values
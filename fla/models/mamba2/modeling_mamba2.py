@@ -30,6 +30,7 @@ from fla.models.mamba2.configuration_mamba2 import Mamba2Config
 from fla.modules import (FusedCrossEntropyLoss, FusedLinearCrossEntropyLoss,
                          RMSNorm)
 from fla.modules.layernorm_gated import RMSNormGated
+from fla.ops.simple_gla import chunk_simple_gla
 
 logger = logging.get_logger(__name__)
 
@@ -63,7 +64,11 @@ def pad_tensor_by_size(input_tensor: torch.Tensor, pad_size: int):
 
     Assumes that we only have tensors of either size 4 or 3
     """
-    pad_shape = (0, 0, 0, 0, 0, pad_size, 0, 0) if len(input_tensor.shape) == 4 else (0, 0, 0, pad_size, 0, 0)
+    # `F.pad` copies even for an empty pad, so aligned inputs are returned as is
+    if pad_size == 0:
+        return input_tensor
+    # `F.pad` consumes the dims from the last one, so only the trailing dims up to seq_len need an entry
+    pad_shape = (0, 0) * (input_tensor.dim() - 2) + (0, pad_size)
 
     return torch.nn.functional.pad(input_tensor, pad_shape, mode="constant", value=0)
 
@@ -78,15 +83,9 @@ def reshape_into_chunks(input_tensor, pad_size, chunk_size):
     # [bsz, seq_len, ...] -> [bsz, seq_len multiple of chunk_size, ...]
     input_tensor = pad_tensor_by_size(input_tensor, pad_size)
 
-    if len(input_tensor.shape) == 3:
-        # [bsz, seq_len multiple of chunk_size, num_heads] -> [bsz, -1, chunk_size, num_heads]
-        return input_tensor.reshape(input_tensor.shape[0], -1, chunk_size, input_tensor.shape[2])
-    else:
-        # [bsz, seq_len multiple of chunk_size, num_heads, head_dim or state_size] ->
-        # [bsz, -1, chunk_size, num_heads, head_dim or state_size]
-        return input_tensor.reshape(
-            input_tensor.shape[0], -1, chunk_size, input_tensor.shape[2], input_tensor.shape[3]
-        )
+    # [bsz, seq_len multiple of chunk_size, num_heads(, head_dim or state_size)] ->
+    # [bsz, -1, chunk_size, num_heads(, head_dim or state_size)]
+    return input_tensor.reshape(input_tensor.shape[0], -1, chunk_size, *input_tensor.shape[2:])
 
 
 def segment_sum(input_tensor):
@@ -97,18 +96,79 @@ def segment_sum(input_tensor):
     # 1. expand input tensor to have an additional dimension and repeat along that dimension
     # [..., chunk_size] -> [..., chunk_size, chunk_size]
     input_tensor = input_tensor[..., None].expand(*input_tensor.size(), chunk_size)
-    # 2. create a lower triangular mask with the diagonal set to 0 to 0 out elements above diag
-    mask = torch.tril(torch.ones(chunk_size, chunk_size, device=input_tensor.device, dtype=torch.bool), diagonal=-1)
-    input_tensor = input_tensor.masked_fill(~mask, 0)
+    # 2. build both triangular masks from a single index comparison instead of two `tril(ones)` allocations
+    # and 0 out elements on and above the diagonal
+    index = torch.arange(chunk_size, device=input_tensor.device)
+    input_tensor = input_tensor.masked_fill(index[:, None] <= index[None, :], 0)
     # 3. compute actual cumsum
     tensor_segsum = torch.cumsum(input_tensor, dim=-2)
 
-    # 4. apply mask to keep only the lower triangular part of the cumulative sum result (incl diagonal this time)
-    mask = torch.tril(torch.ones(chunk_size, chunk_size, device=input_tensor.device, dtype=torch.bool), diagonal=0)
-    tensor_segsum = tensor_segsum.masked_fill(~mask, -torch.inf)
+    # 4. apply mask to keep only the lower triangular part of the cumulative sum result (incl diagonal this time),
+    # in place since the cumsum output is a fresh tensor
+    tensor_segsum.masked_fill_(index[:, None] < index[None, :], -torch.inf)
     return tensor_segsum
 
 
+@torch.jit.script
+def discretize(
+    hidden_states: torch.Tensor,
+    dt: torch.Tensor,
+    dt_bias: torch.Tensor,
+    A: torch.Tensor,
+    dt_min: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Fused `dt = clamp(softplus(dt + dt_bias), dt_min)` followed by the discretization of x and A,
+    i.e., returns `(hidden_states * dt, A * dt)` with `dt` of shape `[..., num_heads]`.
+    """
+    dt = torch.nn.functional.softplus(dt + dt_bias).clamp_min(dt_min)
+    return hidden_states * dt[..., None], A * dt
+
+
+@torch.jit.script
+def ssd_decode_step(
+    hidden_states: torch.Tensor,
+    B: torch.Tensor,
+    C: torch.Tensor,
+    dt: torch.Tensor,
+    dt_bias: torch.Tensor,
+    A: torch.Tensor,
+    D: torch.Tensor,
+    ssm_state: torch.Tensor,
+    dt_min: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Single-token SSM update, scripted so that the chain of small pointwise ops is dispatched in one go.
+    Takes x of shape `[bsz, num_heads, head_dim]`, B/C of shape `[bsz, n_groups * state_size]`, dt of shape
+    `[bsz, num_heads]` and the state of shape `[bsz, num_heads, head_dim, state_size]`.
+    Returns the output (without gating) and the updated state, which is left to the caller to write back.
+    """
+    batch_size, num_heads, head_dim = hidden_states.size(0), hidden_states.size(1), hidden_states.size(2)
+    ssm_state_size = ssm_state.size(-1)
+    n_groups = B.size(-1) // ssm_state_size
+    # Discretize x and A per head, the results are broadcast over head_dim and state_size below
+    # [bsz, num_heads, head_dim], [bsz, num_heads]
+    dtx, dtA = discretize(hidden_states, dt, dt_bias, A, dt_min)
+    # [bsz, num_heads, 1, 1]
+    dA = torch.exp(dtA)[..., None, None]
+
+    # B/C are shared by all heads of a group, so we broadcast them instead of repeating them for each head
+    # [bsz, n_groups, heads per group, head_dim, 1] * [bsz, n_groups, 1, 1, state_size]
+    # -> [bsz, num_heads, head_dim, state_size]
+    dBx = dtx.view(batch_size, n_groups, -1, head_dim, 1) * B.reshape(batch_size, n_groups, 1, 1, -1)
+    ssm_state = (ssm_state * dA + dBx.view(batch_size, num_heads, head_dim, -1)).to(ssm_state.dtype)
+
+    # Merge the heads of each group into the rows of a single matmul per group
+    # [b, g, h/g * d, n] @ [b, g, n, 1] -> [b, g, h/g * d, 1]
+    y = torch.matmul(
+        ssm_state.to(C.dtype).view(batch_size, n_groups, -1, ssm_state_size),
+        C.reshape(batch_size, n_groups, -1, 1)
+    ).view(batch_size, num_heads, head_dim)
+    # D skip connection
+    y = (y + hidden_states * D[:, None]).to(y.dtype)
+    return y, ssm_state
+
+
 class Mamba2Cache:
     """
     Arguments:
@@ -120,8 +180,8 @@ class Mamba2Cache:
     Attributes:
         seqlen_offset: int
         dtype: torch.dtype
-        conv_states: Dict[int, torch.Tensor] # layer_idx -> [batch_size, intermediate_size, conv_kernel_size]
-        ssm_states: Dict[int, torch.Tensor] # layer_idx -> [batch_size, intermediate_size, ssm_state_size]
+        conv_states: torch.Tensor # [num_layers, batch_size, conv_dim, conv_kernel_size]
+        ssm_states: torch.Tensor # [num_layers, batch_size, num_heads, head_dim, ssm_state_size]
     """
 
     def __init__(
@@ -136,27 +196,25 @@ class Mamba2Cache:
         self.conv_kernel_size = config.conv_kernel
         self.intermediate_size = int(config.expand * config.hidden_size)
 
-        self.conv_states = {
-            i: torch.zeros(
-                batch_size,
-                self.intermediate_size + 2 * config.n_groups * config.state_size,
-                self.conv_kernel_size,
-                device=device,
-                dtype=dtype,
-            )
-            for i in range(config.num_hidden_layers)
-        }
-        self.ssm_states = {
-            i: torch.zeros(
-                batch_size,
-                config.num_heads,
-                config.head_dim,
-                config.state_size,
-                device=device,
-                dtype=dtype,
-            )
-            for i in range(config.num_hidden_layers)
-        }
+        # the states of all layers live in one stacked tensor each,
+        # indexing with `layer_idx` returns a contiguous view of the layer's state
+        self.conv_states = torch.zeros(
+            config.num_hidden_layers,
+            batch_size,
+            self.intermediate_size + 2 * config.n_groups * config.state_size,
+            self.conv_kernel_size,
+            device=device,
+            dtype=dtype,
+        )
+        self.ssm_states = torch.zeros(
+            config.num_hidden_layers,
+            batch_size,
+            config.num_heads,
+            config.head_dim,
+            config.state_size,
+            device=device,
+            dtype=dtype,
+        )
         self.activation = config.hidden_act
         self.act = ACT2FN[config.hidden_act]
 
@@ -169,17 +227,15 @@ class Mamba2Cache:
         conv_state = self.conv_states[layer_idx]
         cache_position = cache_position.clamp(0, self.conv_kernel_size - 1)
 
-        conv_state = conv_state.roll(shifts=-1, dims=-1)
-        conv_state[:, :, cache_position] = new_conv_state.to(conv_state.device)
-        self.conv_states[layer_idx].zero_()
-        self.conv_states[layer_idx] += conv_state
-        return self.conv_states[layer_idx]
+        # shift the window and write the new column directly into the cached tensor,
+        # rather than building a rolled copy and adding it back onto a zeroed cache
+        conv_state.copy_(conv_state.roll(shifts=-1, dims=-1))
+        conv_state[:, :, cache_position] = new_conv_state.to(conv_state.device, conv_state.dtype)
+        return conv_state
 
     def reset(self):
-        for layer_idx in self.conv_states:
-            self.conv_states[layer_idx].zero_()
-        for layer_idx in self.ssm_states:
-            self.ssm_states[layer_idx].zero_()
+        self.conv_states.zero_()
+        self.ssm_states.zero_()
 
 
 class Mamba2Mixer(nn.Module):
@@ -298,7 +354,8 @@ class Mamba2Mixer(nn.Module):
             )
             A = -torch.exp(self.A_log.float())  # (nheads,)
 
-            A = A[:, None, ...][:, :, None].expand(-1, self.head_dim, self.ssm_state_size).to(dtype=torch.float32)
+            # broadcast views with zero strides, which `selective_state_update` detects and reads only once per head
+            A = A[:, None, None].expand(-1, self.head_dim, self.ssm_state_size)
             dt = dt[:, :, None].expand(-1, -1, self.head_dim)
             dt_bias = self.dt_bias[:, None, ...].expand(-1, self.head_dim)
             D = self.D[:, None, ...].expand(-1, self.head_dim)
@@ -325,8 +382,7 @@ class Mamba2Mixer(nn.Module):
         else:
             if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
                 # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
-                dtype = hidden_states.dtype
-                hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
+                hidden_states = hidden_states * attention_mask[:, :, None].to(hidden_states.dtype)
             # 1. Gated MLP's linear projection
             projected_states = self.in_proj(hidden_states)
             A = -torch.exp(self.A_log.float())  # (num_heads) or (intermediate_size, state_size)
@@ -380,8 +436,7 @@ class Mamba2Mixer(nn.Module):
                 )
                 if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
                     # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
-                    dtype = hidden_states.dtype
-                    hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
+                    hidden_states = hidden_states * attention_mask[:, :, None].to(hidden_states.dtype)
                 scan_output, ssm_state = mamba_chunk_scan_combined(
                     hidden_states.view(batch_size, seq_len, -1, self.head_dim),
                     time_step,
@@ -406,6 +461,124 @@ class Mamba2Mixer(nn.Module):
         return out
 
     # fmt: off
+    def chunk_ssd(
+        self,
+        hidden_states: torch.Tensor,
+        B: torch.Tensor,
+        C: torch.Tensor,
+        dt: torch.Tensor,
+        A: torch.Tensor,
+        output_final_state: bool = False
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """
+        SSD prefill from an empty state using the chunked kernels of simple GLA.
+
+        Args:
+            hidden_states: `[batch_size, seq_len, num_heads, head_dim]`.
+            B, C: `[batch_size, seq_len, num_heads, state_size]`, already expanded from groups to heads.
+            dt: `[batch_size, seq_len, num_heads]`, before adding `dt_bias`.
+            A: `[num_heads]`.
+
+        Returns:
+            The output of shape `[batch_size, seq_len, num_heads, head_dim]`, and the final state of shape
+            `[batch_size, num_heads, head_dim, state_size]` if `output_final_state` else `None`.
+        """
+        dtx, dtA = discretize(hidden_states, dt, self.dt_bias, A, self.time_step_min)
+        # SSD is a linear attention with a scalar decay per head (q = C, k = B, v = x * dt, log decay A * dt),
+        # so the chunked kernels of simple GLA compute it without materializing the [chunk, chunk] blocks
+        y, ssm_state = chunk_simple_gla(
+            q=C,
+            k=B,
+            # the kernels need operands of one dtype, while discretizing with the fp32 `dt_bias` promotes x * dt
+            v=dtx.to(C.dtype),
+            # the log decays are accumulated in fp32 by the kernels
+            g=dtA.float(),
+            scale=1.,
+            output_final_state=output_final_state,
+            head_first=False
+        )
+        # D skip connection, fused into a single multiply-add
+        y = torch.addcmul(y, hidden_states, self.D[..., None])
+        # [bsz, num_heads, state_size, head_dim] -> [bsz, num_heads, head_dim, state_size]
+        return y, (ssm_state.transpose(-1, -2) if ssm_state is not None else None)
+
+    def naive_ssd(
+        self,
+        hidden_states: torch.Tensor,
+        B: torch.Tensor,
+        C: torch.Tensor,
+        dt: torch.Tensor,
+        A: torch.Tensor,
+        output_final_state: bool = False
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """
+        Reference SSD prefill in plain PyTorch, computed in fp32.
+        Takes the same inputs and returns the same outputs as `chunk_ssd`.
+        """
+        batch_size, seq_len = hidden_states.shape[:2]
+        hidden_states, B, C = hidden_states.float(), B.float(), C.float()
+        pad_size = (self.chunk_size - seq_len % self.chunk_size) % self.chunk_size
+
+        # the D skip connection is applied after cutting off the padded chunks, so x is kept unpadded
+        residual = hidden_states
+        # Discretize x and A
+        hidden_states, A = discretize(hidden_states, dt, self.dt_bias, A, self.time_step_min)
+
+        # Rearrange into blocks/chunks
+        hidden_states, A, B, C = [reshape_into_chunks(t, pad_size, self.chunk_size) for t in (hidden_states, A, B, C)]
+
+        # [bsz, -1, chunk_size, num_heads] -> [bsz, num_heads, -1, chunk_size]
+        A = A.permute(0, 3, 1, 2)
+        A_cumsum = torch.cumsum(A, dim=-1)
+
+        # 1. Compute the output for each intra-chunk (diagonal blocks)
+        # This is the analog of a causal mask
+        L = torch.exp(segment_sum(A))
+
+        # The contractions below are expressed as einsums, which lower to batched matmuls
+        # instead of materializing the broadcast products before reducing them
+        # Contraction of C and B to get G (attention-weights like)
+        G = torch.einsum('bclhn,bcshn->bclsh', C, B)  # shape: (b, c, l, s, h)
+
+        # Compute M, equivalent to applying attention mask to weights
+        M = G * L.permute(0, 2, 3, 4, 1)
+
+        # Compute Y_diag (apply to values)
+        Y_diag = torch.einsum('bclsh,bcshp->bclhp', M, hidden_states)
+
+        # 2. Compute the state for each intra-chunk
+        # (right term of low-rank factorization of off-diagonal blocks; B terms)
+        decay_states = torch.exp((A_cumsum[:, :, :, -1:] - A_cumsum))
+        B_decay = B * decay_states.permute(0, -2, -1, 1)[..., None]
+        states = torch.einsum('bclhn,bclhp->bchpn', B_decay, hidden_states)
+
+        # 3. Compute the inter-chunk SSM recurrence; produces correct SSM states at chunk boundaries
+        # (middle term of factorization of off-diag blocks; A terms)
+        # prefilling always starts from an empty state, decoding steps go through `ssd_decode_step`
+        states = torch.cat([torch.zeros_like(states[:, :1]), states], dim=1)
+        decay_chunk = torch.exp(segment_sum(nn.functional.pad(A_cumsum[:, :, :, -1], (1, 0))))
+        new_states = torch.einsum('bhzc,bchpn->bzhpn', decay_chunk, states)
+        states, ssm_state = new_states[:, :-1], new_states[:, -1]
+
+        # 4. Compute state -> output conversion per chunk
+        # (left term of low-rank factorization of off-diagonal blocks; C terms)
+        state_decay_out = torch.exp(A_cumsum)
+        C_times_states = torch.einsum('bclhn,bchpn->bclhp', C, states)
+        state_decay_out_permuted = state_decay_out.permute(0, 2, 3, 1)
+        Y_off = C_times_states * state_decay_out_permuted[..., None]
+
+        # Add output of intra-chunk and inter-chunk terms (diagonal and off-diagonal blocks)
+        y = Y_diag + Y_off
+        # [bsz, -1, self.chunk_size, num_heads, head_dim] -> [bsz, (padded) seq_len, num_heads, head_dim]
+        y = y.reshape(batch_size, -1, self.num_heads, self.head_dim)
+
+        # Cutting off padded chunks
+        if pad_size > 0:
+            y = y[:, :seq_len, :, :]
+        # D skip connection, fused into a single multiply-add
+        y = torch.addcmul(y, residual, self.D[..., None])
+        return y, (ssm_state if output_final_state else None)
+
     def torch_forward(
         self,
         input_states,
@@ -425,8 +598,6 @@ class Mamba2Mixer(nn.Module):
 
         # Convolution sequence transformation
         if cache_params is not None:
-            ssm_state = cache_params.ssm_states[self.layer_idx].clone()
-            ssm_state = ssm_state.to(hidden_states.device)
             if cache_params.seqlen_offset > 0:
                 # [batch, intermediate_size, conv_kernel_size]
                 conv_state = cache_params.conv_states[self.layer_idx]
@@ -449,14 +620,9 @@ class Mamba2Mixer(nn.Module):
                 # [batch, intermediate_size, seq_len]
                 hidden_states = self.act(self.conv1d(hidden_states).transpose(1, 2))[:, :seq_len, :]
                 if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
-                    dtype = hidden_states.dtype
                     # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
-                    hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
+                    hidden_states = hidden_states * attention_mask[:, :, None].to(hidden_states.dtype)
         else:
-            ssm_state = torch.zeros(
-                (batch_size, self.num_heads, self.head_dim, self.ssm_state_size),
-                device=hidden_states.device, dtype=dtype
-            )
             hidden_states = self.act(self.conv1d(hidden_states.transpose(1, 2))[..., :seq_len].transpose(1, 2))
         hidden_states, B, C = torch.split(
             hidden_states,
@@ -467,132 +633,30 @@ class Mamba2Mixer(nn.Module):
         if cache_params is not None and cache_params.seqlen_offset > 0:
             # Note: there is no need to pad parameter matrices here, as there is just one new token
             # for batched generation
-            dt = dt[:, None, ...] if dt.ndim == 2 else dt[:, 0, :][:, None, ...]
-            dt = dt.transpose(1, 2).expand(batch_size, dt.shape[-1], self.head_dim)
-            # [num_heads] -> [num_heads, head_dim]
-            dt_bias = self.dt_bias[..., None].expand(self.dt_bias.shape[0], self.head_dim)
-
-            dt = torch.nn.functional.softplus(dt + dt_bias.to(dt.dtype))
-            dt = torch.clamp(dt, self.time_step_min)
-            A = A[..., None, None].expand(self.num_heads, self.head_dim, self.ssm_state_size).to(dtype=torch.float32)
-            # [bsz, num_heads, head_dim, state_size]
-            dA = torch.exp(dt[..., None] * A)
-
-            # Discretize B
-            # [bsz, n_groups * state_size] -> [bsz, n_groups, 1, state_size] ->
-            # -> [bsz, n_groups, group to head repetition factor, state_size] -> [bsz, num_heads, state_size]
-            B = B.reshape(batch_size, self.n_groups, -1)[..., None, :]
-            B = B.expand(batch_size, self.n_groups, self.num_heads // self.n_groups, B.shape[-1]).contiguous()
-            B = B.reshape(batch_size, -1, B.shape[-1])
-            # [bsz, num_heads, head_dim, state_size]
-            dB = dt[..., None] * B[..., None, :]
-
-            # Discretize x into dB
-            # [bsz, intermediate_size] -> [bsz, num_heads, head_dim]
-            hidden_states = hidden_states.reshape(batch_size, -1, self.head_dim)
-            dBx = dB * hidden_states[..., None]
-
-            # State calculation
-            cache_params.ssm_states[self.layer_idx].copy_(
-                cache_params.ssm_states[self.layer_idx] * dA + dBx
+            y, ssm_state = ssd_decode_step(
+                # [bsz, intermediate_size] -> [bsz, num_heads, head_dim]
+                hidden_states.reshape(batch_size, -1, self.head_dim),
+                B.reshape(batch_size, -1),
+                C.reshape(batch_size, -1),
+                dt.reshape(batch_size, -1),
+                self.dt_bias.to(dt.dtype),
+                A,
+                self.D,
+                cache_params.ssm_states[self.layer_idx],
+                self.time_step_min
             )
-
-            # Subsequent output
-            # [bsz, n_groups * state_size] -> [bsz, num_heads, state_size]
-            C = C.reshape(batch_size, self.n_groups, -1)[..., None, :]
-            C = C.expand(batch_size, self.n_groups, self.num_heads // self.n_groups, C.shape[-1]).contiguous()
-            C = C.reshape(batch_size, -1, C.shape[-1])
-            # [bsz, num_heads, head_dim]
-
-            ssm_states = cache_params.ssm_states[self.layer_idx].to(C.dtype)  # Shape: [b, h, d, n]
-            # Reshape ssm_states to merge the first two dimensions
-            # Shape: [b*h, d, n]
-            ssm_states_reshaped = ssm_states.view(batch_size * self.num_heads, self.head_dim, self.ssm_state_size)
-            C_reshaped = C.view(batch_size * self.num_heads, self.ssm_state_size, 1)  # Shape: [b*h, n, 1]
-            y = torch.bmm(ssm_states_reshaped, C_reshaped)
-            y = y.view(batch_size, self.num_heads, self.head_dim)
-
-            # D skip connection
-            # [num_heads] -> [num_heads, head_dim]
-            D = self.D[..., None].expand(self.D.shape[0], self.head_dim)
-            y = (y + hidden_states * D).to(y.dtype)
+            cache_params.ssm_states[self.layer_idx].copy_(ssm_state)
 
             # [bsz, num_heads, head_dim] -> [bsz, 1, intermediate_size]
             y = y.reshape(batch_size, -1)[:, None, ...]
         else:
-            # begin ssd naive implementation without einsums
-            dt = nn.functional.softplus(dt + self.dt_bias)
-            dt = torch.clamp(dt, self.time_step_min)
-            hidden_states = hidden_states.reshape(batch_size, seq_len, -1, self.head_dim).float()
-            B = B.reshape(batch_size, seq_len,  -1, self.ssm_state_size).float()
-            C = C.reshape(batch_size, seq_len, -1, self.ssm_state_size).float()
-            B = B.repeat(1, 1, self.num_heads // self.n_groups, 1)
-            C = C.repeat(1, 1, self.num_heads // self.n_groups, 1)
-            pad_size = (self.chunk_size - seq_len % self.chunk_size) % self.chunk_size
-
-            D_residual = self.D[..., None] * pad_tensor_by_size(hidden_states, pad_size)
-
-            # Discretize x and A
-            hidden_states = hidden_states * dt[..., None]
-            A = A.to(hidden_states.dtype) * dt
-
-            # Rearrange into blocks/chunks
-            hidden_states, A, B, C = [reshape_into_chunks(t, pad_size, self.chunk_size) for t in (hidden_states, A, B, C)]
-
-            # [bsz, -1, chunk_size, num_heads] -> [bsz, num_heads, -1, chunk_size]
-            A = A.permute(0, 3, 1, 2)
-            A_cumsum = torch.cumsum(A, dim=-1)
-
-            # 1. Compute the output for each intra-chunk (diagonal blocks)
-            # This is the analog of a causal mask
-            L = torch.exp(segment_sum(A))
-
-            # Contraction of C and B to get G (attention-weights like)
-            # shape: (b, c, l, s, h, n)
-            G_intermediate = C[:, :, :, None, :, :] * B[:, :, None, :, :, :]
-            G = G_intermediate.sum(dim=-1)  # shape: (b, c, l, s, h)
-
-            # Compute M, equivalent to applying attention mask to weights
-            M_intermediate = G[..., None] * L.permute(0, 2, 3, 4, 1)[..., None]
-            M = M_intermediate.sum(dim=-1)
-
-            # Compute Y_diag (apply to values)
-            Y_diag = (M[..., None] * hidden_states[:, :, None]).sum(dim=3)
-
-            # 2. Compute the state for each intra-chunk
-            # (right term of low-rank factorization of off-diagonal blocks; B terms)
-            decay_states = torch.exp((A_cumsum[:, :, :, -1:] - A_cumsum))
-            B_decay = B * decay_states.permute(0, -2, -1, 1)[..., None]
-            states = (B_decay[..., None, :] * hidden_states[..., None]).sum(dim=2)
-
-            # 3. Compute the inter-chunk SSM recurrence; produces correct SSM states at chunk boundaries
-            # (middle term of factorization of off-diag blocks; A terms)
-            if cache_params is not None and cache_params.seqlen_offset > 0:
-                previous_states = cache_params.ssm_states[self.layer_idx][:, None, ...]
-            else:
-                previous_states = torch.zeros_like(states[:, :1])
-            states = torch.cat([previous_states, states], dim=1)
-            decay_chunk = torch.exp(segment_sum(nn.functional.pad(A_cumsum[:, :, :, -1], (1, 0))))
-            decay_chunk = decay_chunk.transpose(1, 3)
-            new_states = (decay_chunk[..., None, None] * states[:, :, None, ...]).sum(dim=1)
-            states, ssm_state = new_states[:, :-1], new_states[:, -1]
-
-            # 4. Compute state -> output conversion per chunk
-            # (left term of low-rank factorization of off-diagonal blocks; C terms)
-            state_decay_out = torch.exp(A_cumsum)
-            C_times_states = (C[..., None, :] * states[:, :, None, ...])
-            state_decay_out_permuted = state_decay_out.permute(0, 2, 3, 1)
-            Y_off = (C_times_states.sum(-1) * state_decay_out_permuted[..., None])
-
-            # Add output of intra-chunk and inter-chunk terms (diagonal and off-diagonal blocks)
-            y = Y_diag + Y_off
-            # [bsz, -1, self.chunk_size, num_heads, head_dim] -> [bsz, (padded) seq_len, num_heads, head_dim]
-            y = y.reshape(batch_size, -1, self.num_heads, self.head_dim)
-
-            y = y + D_residual
-            # Cutting off padded chunks
-            if pad_size > 0:
-                y = y[:, :seq_len, :, :]
+            hidden_states = hidden_states.reshape(batch_size, seq_len, -1, self.head_dim)
+            B = B.reshape(batch_size, seq_len, -1, self.ssm_state_size)
+            C = C.reshape(batch_size, seq_len, -1, self.ssm_state_size)
+            # heads are mapped onto groups contiguously, i.e., head h reads group h // (num_heads // n_groups)
+            B, C = (x.repeat_interleave(self.num_heads // self.n_groups, 2) for x in (B, C))
+            ssd = self.chunk_ssd if hidden_states.is_cuda else self.naive_ssd
+            y, ssm_state = ssd(hidden_states, B, C, dt, A, output_final_state=cache_params is not None)
             y = y.reshape(batch_size, seq_len, -1)
             if ssm_state is not None and cache_params is not None:
                 cache_params.ssm_states[self.layer_idx].copy_(ssm_state)
@@ -614,10 +678,9 @@ class Mamba2Mixer(nn.Module):
     ):
         if is_fast_path_available and "cuda" in self.in_proj.weight.device.type:
             return self.cuda_kernels_forward(hidden_states, cache_params, cache_position, attention_mask)
-        dtype = hidden_states.dtype
         if attention_mask is not None and attention_mask.shape[1] > 1 and attention_mask.shape[0] > 1:
             # tune out hidden states for pad tokens, see https://github.com/state-spaces/mamba/issues/66
-            hidden_states = (hidden_states * attention_mask[:, :, None]).to(dtype)
+            hidden_states = hidden_states * attention_mask[:, :, None].to(hidden_states.dtype)
 
         return self.torch_forward(hidden_states, cache_params, cache_position, attention_mask)
 
@@ -634,14 +697,19 @@ class Mamba2Block(nn.Module):
     def forward(
         self,
         hidden_states,
+        residual: Optional[torch.Tensor] = None,
         cache_params: Optional[Mamba2Cache] = None,
         cache_position: Optional[torch.LongTensor] = None,
         attention_mask: Optional[torch.Tensor] = None,
     ):
-        residual = hidden_states
-        hidden_states = self.norm(hidden_states.to(dtype=self.norm.weight.dtype))
-        if self.residual_in_fp32:
-            residual = residual.to(torch.float32)
+        # the residual addition of the previous block is deferred and fused into the norm of this block,
+        # which returns both the normalized input and the updated residual stream
+        hidden_states, residual = self.norm(
+            hidden_states,
+            residual=residual,
+            prenorm=True,
+            residual_in_fp32=self.residual_in_fp32
+        )
 
         hidden_states = self.mixer(
             hidden_states,
@@ -649,8 +717,7 @@ class Mamba2Block(nn.Module):
             cache_position=cache_position,
             attention_mask=attention_mask,
         )
-        hidden_states = residual + hidden_states
-        return hidden_states
+        return hidden_states, residual
 
 
 class Mamba2PreTrainedModel(PreTrainedModel, GenerationMixin):
@@ -697,15 +764,17 @@ class Mamba2PreTrainedModel(PreTrainedModel, GenerationMixin):
             #   >   -- GPT-2 :: https://openai.com/blog/better-language-models/
             #
             # Reference (Megatron-LM): https://github.com/NVIDIA/Megatron-LM/blob/main/megatron/model/gpt_model.py
-            for name, p in module.named_parameters():
-                if name in ["out_proj.weight"]:
-                    # Special Scaled Initialization --> There are 2 Layer Norms per Transformer Block
-                    # Following Pytorch init, except scale by 1/sqrt(2 * n_layer)
-                    # We need to reinit p since this code could be called multiple times
-                    # Having just p *= scale would repeatedly scale it down
-                    nn.init.kaiming_uniform_(p, a=math.sqrt(5))
-                    with torch.no_grad():
-                        p /= math.sqrt(self.config.num_hidden_layers)
+            # only the direct `out_proj` child is targeted, so look it up rather than scanning all parameters
+            out_proj = getattr(module, 'out_proj', None)
+            if isinstance(out_proj, nn.Linear):
+                p = out_proj.weight
+                # Special Scaled Initialization --> There are 2 Layer Norms per Transformer Block
+                # Following Pytorch init, except scale by 1/sqrt(2 * n_layer)
+                # We need to reinit p since this code could be called multiple times
+                # Having just p *= scale would repeatedly scale it down
+                nn.init.kaiming_uniform_(p, a=math.sqrt(5))
+                with torch.no_grad():
+                    p /= math.sqrt(self.config.num_hidden_layers)
 
 
 @dataclass
@@ -835,32 +904,35 @@ class Mamba2Model(Mamba2PreTrainedModel):
         else:
             cache_params = None
 
-        hidden_states = inputs_embeds
+        hidden_states, residual = inputs_embeds, None
         all_hidden_states = () if output_hidden_states else None
         for mixer_block in self.layers:
             if self.gradient_checkpointing and self.training:
-                hidden_states = self._gradient_checkpointing_func(
+                hidden_states, residual = self._gradient_checkpointing_func(
                     mixer_block.__call__,
                     hidden_states,
+                    residual,
                     cache_params,
                     cache_position,
                     attention_mask,
                 )
             else:
-                hidden_states = mixer_block(
+                hidden_states, residual = mixer_block(
                     hidden_states,
+                    residual=residual,
                     cache_params=cache_params,
                     cache_position=cache_position,
                     attention_mask=attention_mask,
                 )
 
             if output_hidden_states:
-                all_hidden_states = all_hidden_states + (hidden_states,)
+                all_hidden_states = all_hidden_states + (residual + hidden_states,)
 
         if use_cache:
             cache_params.seqlen_offset += inputs_embeds.shape[1]
 
-        hidden_states = self.norm_f(hidden_states)
+        # the last residual addition is fused into the final norm
+        hidden_states = self.norm_f(hidden_states, residual=residual)
 
         if output_hidden_states:
             all_hidden_states = all_hidden_states + (hidden_states,)
@@ -920,38 +992,32 @@ class Mamba2ForCausalLM(Mamba2PreTrainedModel):
                     "`model.generate`, you are responsible for passing in a valid `cache_position` if "
                     "you are calling `prepare_inputs_for_generation` directly with `use_cache=True`"
                 )
-            # how do we detect that we are in decoding without cache?
-            if cache_position[0] > 0:
-                input_ids = input_ids[:, -1][..., None]
+        if use_cache and cache_position[0] > 0:
+            # decoding with cache: only the last token is fed, so its mask entry is all we need
+            input_ids = input_ids[:, -1][..., None]
+            if attention_mask is not None:
                 attention_mask = attention_mask[:, -1][..., None]
-            else:
+        else:
+            if use_cache:
                 # we initialize the `cache_position` to full size of `conv_states` at prefill stage
                 # considering padding will be applied when input length is shorter, and truncation
                 # will be applied when it is longer, so it will be equivalent to always have it match
                 # the length of `cache_params.conv_states`, which is `config.conv_kernel`
                 cache_position = torch.arange(0, past_len, device=input_ids.device)
-                # if the cache is not used, we also do have to extend the attention mask here
-                # TODO there is likely a cleverer way to do this
-                extended_mask = torch.ones(
-                    attention_mask.size(0), past_len - attention_mask.shape[1], device=attention_mask.device
-                )
-                attention_mask = torch.cat([attention_mask, extended_mask], dim=1)
                 cache_params = None
-
-        if attention_mask.shape[1] < past_len:
-            # we have to update manually the attention mask if
-            # we are in decoding without cache
-            # and we don't have position_ids here
-            # TODO but we should be able to use cache_position though at a later time
-            extended_mask = torch.ones(
-                attention_mask.size(0), past_len - attention_mask.shape[1], device=attention_mask.device
-            )
-            attention_mask = torch.cat([attention_mask, extended_mask], dim=1)
+            # extend the attention mask manually if it does not cover all positions yet,
+            # e.g., in prefill with `inputs_embeds` or in decoding without cache
+            if attention_mask is not None and attention_mask.shape[1] < past_len:
+                attention_mask = torch.cat(
+                    (attention_mask, attention_mask.new_ones(attention_mask.shape[0], past_len - attention_mask.shape[1])),
+                    dim=1
+                )
         if inputs_embeds is not None and cache_params is None:
             model_inputs = {"inputs_embeds": inputs_embeds}
         else:
             model_inputs = {"input_ids": input_ids}
 
+        # `generate` asks for the last position only, so the lm_head is applied to [B, 1, D] rather than [B, T, D]
         if num_logits_to_keep is not None:
             model_inputs['num_logits_to_keep'] = num_logits_to_keep
 
@@ -959,8 +1025,7 @@ class Mamba2ForCausalLM(Mamba2PreTrainedModel):
             'attention_mask': attention_mask,
             'cache_params': cache_params,
             'use_cache': use_cache,
-            'cache_position': cache_position,
-            'num_logits_to_keep': num_logits_to_keep
+            'cache_position': cache_position
         })
         return model_inputs
 
@@ -1010,8 +1075,10 @@ class Mamba2ForCausalLM(Mamba2PreTrainedModel):
             else:
                 loss_fct = nn.CrossEntropyLoss()
             # Enable model parallelism
-            labels = labels.to(hidden_states.device)
-            labels = torch.cat((labels[..., 1:], torch.full_like(labels[:, :1], loss_fct.ignore_index)), 1)
+            # the copy is asynchronous for pinned labels and is ordered before the loss on the current stream
+            labels = labels.to(hidden_states.device, non_blocking=True)
+            # shift the labels rather than the logits, so no [B, T-1, V] copy is made
+            labels = nn.functional.pad(labels[..., 1:], (0, 1), value=loss_fct.ignore_index)
             if fuse_linear_and_cross_entropy:
                 loss = loss_fct(hidden_states.view(-1, self.config.hidden_size),
                                 labels.view(-1),
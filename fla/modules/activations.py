@@ -2,6 +2,8 @@
 
 # Copyright (c) 2023-2024, Tri Dao, Yu Zhang, Songlin Yang.
 
+from typing import Optional
+
 import torch
 import torch.nn.functional as F
 import triton
@@ -57,10 +59,12 @@ sigmoid = SigmoidFunction.apply
 def logsigmoid_fwd_kernel(
     x,
     y,
-    temperature,
+    scale,
+    clamp_min,
     T: tl.constexpr,
     D: tl.constexpr,
-    B: tl.constexpr
+    B: tl.constexpr,
+    USE_CLAMP: tl.constexpr
 ):
     i = tl.program_id(0)
     o_i = i * B + tl.arange(0, B)
@@ -69,7 +73,9 @@ def logsigmoid_fwd_kernel(
     b_x = tl.load(x + o_i, mask=m_i, other=0.).to(tl.float32)
     b_m = tl.minimum(0., b_x)
     b_z = 1. + tl.exp(-tl.abs(b_x))
-    b_y = (b_m - tl.log(b_z)) / temperature
+    b_y = (b_m - tl.log(b_z)) * scale
+    if USE_CLAMP:
+        b_y = tl.maximum(b_y, clamp_min)
     tl.store(y + o_i, b_y.to(y.dtype.element_ty), mask=m_i)
 
 
@@ -89,10 +95,12 @@ def logsigmoid_bwd_kernel(
     x,
     dx,
     dy,
-    temperature,
+    scale,
+    clamp_min,
     T: tl.constexpr,
     D: tl.constexpr,
-    B: tl.constexpr
+    B: tl.constexpr,
+    USE_CLAMP: tl.constexpr
 ):
     i = tl.program_id(0)
     o_i = i * B + tl.arange(0, B)
@@ -100,26 +108,38 @@ def logsigmoid_bwd_kernel(
 
     b_x = tl.load(x + o_i, mask=m_i, other=0.).to(tl.float32)
     b_dy = tl.load(dy + o_i, mask=m_i, other=0.).to(tl.float32)
-    b_dx = b_dy * (1. - tl.sigmoid(b_x)) / temperature
+    b_dx = b_dy * (1. - tl.sigmoid(b_x)) * scale
+    if USE_CLAMP:
+        # recompute the outputs to block the gradients of the clamped elements
+        b_y = (tl.minimum(0., b_x) - tl.log(1. + tl.exp(-tl.abs(b_x)))) * scale
+        b_dx = tl.where(b_y >= clamp_min, b_dx, 0.)
     tl.store(dx + o_i, b_dx.to(dx.dtype.element_ty), mask=m_i)
 
 
-def logsigmoid_fwd(x: torch.Tensor, temperature: float = 1.) -> torch.Tensor:
+def logsigmoid_fwd(x: torch.Tensor, temperature: float = 1., clamp_min: Optional[float] = None) -> torch.Tensor:
     T, D = x.numel(), x.shape[-1]
     B = triton.next_power_of_2(triton.cdiv(T, torch.cuda.get_device_properties(x.device).multi_processor_count))
     y = torch.empty_like(x)
     logsigmoid_fwd_kernel[(triton.cdiv(T, B),)](
         x=x,
         y=y,
-        temperature=temperature,
+        # multiplying by the reciprocal is cheaper than dividing every element by the temperature
+        scale=1. / temperature,
+        clamp_min=clamp_min if clamp_min is not None else 0.,
         T=T,
         D=D,
-        B=B
+        B=B,
+        USE_CLAMP=clamp_min is not None
     )
     return y
 
 
-def logsigmoid_bwd(x: torch.Tensor, dy: torch.Tensor, temperature: float = 1.) -> torch.Tensor:
+def logsigmoid_bwd(
+    x: torch.Tensor,
+    dy: torch.Tensor,
+    temperature: float = 1.,
+    clamp_min: Optional[float] = None
+) -> torch.Tensor:
     T, D = x.numel(), x.shape[-1]
     B = triton.next_power_of_2(triton.cdiv(T, torch.cuda.get_device_properties(x.device).multi_processor_count))
     dx = torch.empty_like(x)
@@ -127,10 +147,12 @@ def logsigmoid_bwd(x: torch.Tensor, dy: torch.Tensor, temperature: float = 1.) -
         x=x,
         dx=dx,
         dy=dy,
-        temperature=temperature,
+        scale=1. / temperature,
+        clamp_min=clamp_min if clamp_min is not None else 0.,
         T=T,
         D=D,
-        B=B
+        B=B,
+        USE_CLAMP=clamp_min is not None
     )
     return dx
 
@@ -139,20 +161,25 @@ class LogSigmoidFunction(torch.autograd.Function):
 
     @staticmethod
     @contiguous
-    def forward(ctx, x, temperature):
+    def forward(ctx, x, temperature, clamp_min):
         ctx.save_for_backward(x,)
         ctx.temperature = temperature
-        return logsigmoid_fwd(x, temperature)
+        ctx.clamp_min = clamp_min
+        return logsigmoid_fwd(x, temperature, clamp_min)
 
     @staticmethod
     @contiguous
     def backward(ctx, dy):
         x, = ctx.saved_tensors
-        return logsigmoid_bwd(x, dy, ctx.temperature), None
+        return logsigmoid_bwd(x, dy, ctx.temperature, ctx.clamp_min), None, None
 
 
-def logsigmoid(x: torch.Tensor, temperature: float = 1.) -> torch.Tensor:
-    return LogSigmoidFunction.apply(x, temperature)
+def logsigmoid(x: torch.Tensor, temperature: float = 1., clamp_min: Optional[float] = None) -> torch.Tensor:
+    r"""
+    Computes `max(logsigmoid(x) / temperature, clamp_min)` in a single elementwise pass.
+    The clamp is skipped if `clamp_min` is `None`.
+    """
+    return LogSigmoidFunction.apply(x, temperature, clamp_min)
 
 
 swish_fwd_codestring = """
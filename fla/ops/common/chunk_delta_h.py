@@ -18,10 +18,12 @@ from fla.utils import tensor_cache
 })
 @triton.autotune(
     configs=[
-        triton.Config({}, num_warps=num_warps)
+        triton.Config({'BV': BV}, num_warps=num_warps, num_stages=num_stages)
+        for BV in [32, 64]
         for num_warps in [2, 4, 8, 16]
+        for num_stages in [2, 3]
     ],
-    key=['BT', 'BK', 'BV', 'USE_G'],
+    key=['BT', 'BC', 'BK', 'V', 'USE_G'],
 )
 @triton.jit
 def chunk_gated_delta_rule_fwd_kernel_h(
@@ -85,6 +87,7 @@ def chunk_gated_delta_rule_fwd_kernel_h(
             b_g_last = None
             last_idx = None
         # since we need to make all DK in the SRAM. we face serve SRAM memory burden. By subchunking we allievate such burden
+        # each input tile is streamed exactly once per program, so cache it in L2 only (.cg) rather than polluting L1
         for i_c in range(tl.cdiv(min(BT, T - i_t * BT), BC)):
             if HEAD_FIRST:
                 p_k = tl.make_block_ptr(k + i_nh * T*K, (K, T), (1, K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
@@ -100,17 +103,17 @@ def chunk_gated_delta_rule_fwd_kernel_h(
                 p_g = tl.make_block_ptr(g+bos*H+i_h, (T,), (H,), (i_t*BT+i_c*BC, ), (BC,), (0,)) if USE_G else None
             b_g = tl.load(p_g, boundary_check=(0, )) if USE_G else None
             # [BK, BC]
-            b_k = tl.load(p_k, boundary_check=(0, 1))
+            b_k = tl.load(p_k, boundary_check=(0, 1), cache_modifier=".cg")
             b_k = (b_k * tl.exp(b_g_last - b_g)[None, :]).to(b_k.dtype) if USE_G else b_k
             # [BC, BK]
-            b_d = tl.load(p_d, boundary_check=(0, 1))
+            b_d = tl.load(p_d, boundary_check=(0, 1), cache_modifier=".cg")
             b_d = (b_d * tl.exp(b_g)[:, None]).to(b_d.dtype) if USE_G else b_d
             # [BC, BV]
-            b_v = tl.load(p_v, boundary_check=(0, 1))
+            b_v = tl.load(p_v, boundary_check=(0, 1), cache_modifier=".cg")
             b_v2 = b_v - tl.dot(b_d, b_h.to(b_d.dtype))
             # [BK, BV]
             tl.store(p_v_new, b_v2.to(p_v_new.dtype.element_ty), boundary_check=(0, 1))
-            b_hc += tl.dot(b_k, b_v2.to(b_k.dtype), allow_tf32=False)
+            b_hc += tl.dot(b_k, b_v2.to(b_k.dtype))
         b_h *= tl.exp(b_g_last) if USE_G else 1
         b_h += b_hc
 
@@ -127,10 +130,12 @@ def chunk_gated_delta_rule_fwd_kernel_h(
 })
 @triton.autotune(
     configs=[
-        triton.Config({}, num_warps=num_warps)
+        triton.Config({'BV': BV}, num_warps=num_warps, num_stages=num_stages)
+        for BV in [32, 64]
         for num_warps in [2, 4, 8, 16]
+        for num_stages in [2, 3]
     ],
-    key=['BT', 'BK', 'BV', 'USE_G'],
+    key=['BT', 'BC', 'BK', 'V', 'USE_G'],
 )
 @triton.jit
 def chunk_gated_delta_rule_bwd_kernel_dhu(
@@ -195,6 +200,7 @@ def chunk_gated_delta_rule_bwd_kernel_dhu(
         else:
             bg_last = None
             last_idx = None
+        # inputs are streamed once per program, so they are cached in L2 only (.cg)
         for i_c in range(tl.cdiv(BT, BC) - 1, -1, -1):
             if HEAD_FIRST:
                 p_q = tl.make_block_ptr(q + i_nh * T*K, (K, T), (1, K), (i_k * BK, i_t * BT + i_c * BC), (BK, BC), (0, 1))
@@ -214,21 +220,21 @@ def chunk_gated_delta_rule_bwd_kernel_dhu(
                 p_dv2 = tl.make_block_ptr(dv2+(bos*H+i_h)*V, (T, V), (H*V, 1), (i_t*BT + i_c * BC, i_v * BV), (BC, BV), (1, 0))
             b_g = tl.load(p_g, boundary_check=(0,)) if USE_G else None
             # [BK, BT]
-            b_q = tl.load(p_q, boundary_check=(0, 1))
+            b_q = tl.load(p_q, boundary_check=(0, 1), cache_modifier=".cg")
             b_q = (b_q * scale * tl.exp(b_g)[None, :]).to(b_q.dtype) if USE_G else (b_q * scale).to(b_q.dtype)
             # [BT, BK]
-            b_k = tl.load(p_k, boundary_check=(0, 1))
-            b_d = tl.load(p_d, boundary_check=(0, 1))
+            b_k = tl.load(p_k, boundary_check=(0, 1), cache_modifier=".cg")
+            b_d = tl.load(p_d, boundary_check=(0, 1), cache_modifier=".cg")
             b_k = (b_k * tl.exp(bg_last - b_g)[:, None]).to(b_k.dtype) if USE_G else b_k
             b_d = (b_d * tl.exp(b_g)[None, :]).to(b_d.dtype) if USE_G else b_d
             # [BT, V]
-            b_do = tl.load(p_do, boundary_check=(0, 1))
-            b_dv = tl.load(p_dv, boundary_check=(0, 1))
-            b_dv2 = b_dv + tl.dot(b_k, b_dh.to(b_k.dtype), allow_tf32=False)
+            b_do = tl.load(p_do, boundary_check=(0, 1), cache_modifier=".cg")
+            b_dv = tl.load(p_dv, boundary_check=(0, 1), cache_modifier=".cg")
+            b_dv2 = b_dv + tl.dot(b_k, b_dh.to(b_k.dtype))
             tl.store(p_dv2, b_dv2.to(p_dv.dtype.element_ty), boundary_check=(0, 1))
             # [BK, BV]
-            b_dh_tmp += tl.dot(b_q, b_do.to(b_q.dtype), allow_tf32=False)
-            b_dh_tmp -= tl.dot(b_d, b_dv2.to(b_q.dtype), allow_tf32=False)
+            b_dh_tmp += tl.dot(b_q, b_do.to(b_q.dtype))
+            b_dh_tmp -= tl.dot(b_d, b_dv2.to(b_q.dtype))
         b_dh *= tl.exp(bg_last) if USE_G else 1
         b_dh += b_dh_tmp
 
@@ -270,20 +276,13 @@ def chunk_gated_delta_rule_fwd_h(
         NT = chunk_offsets[-1]
     BK = triton.next_power_of_2(K)
     assert BK <= 256, "current kernel does not support head dimension larger than 256."
-    # H100 can have larger block size
-    if torch.cuda.get_device_capability()[0] >= 9:
-        BV = 64
-        BC = 64
-    # A100
-    elif torch.cuda.get_device_capability() == (8, 0):
-        BV = 32
+    # H100 and A100 can afford larger subchunks
+    if torch.cuda.get_device_capability()[0] >= 9 or torch.cuda.get_device_capability() == (8, 0):
         BC = 64
     else:
-        BV = 32
         BC = 64 if K <= 128 else 32
     BC = min(BT, BC)
     NK = triton.cdiv(K, BK)
-    NV = triton.cdiv(V, BV)
     assert NK == 1, 'NK > 1 is not supported because it involves time-consuming synchronization'
 
     if head_first:
@@ -293,7 +292,9 @@ def chunk_gated_delta_rule_fwd_h(
     final_state = k.new_empty(N, H, K, V, dtype=torch.float32) if output_final_state else None
 
     v_new = torch.empty_like(u)
-    grid = (NK, NV, N * H)
+
+    def grid(meta):
+        return (NK, triton.cdiv(V, meta['BV']), N * H)
 
     chunk_gated_delta_rule_fwd_kernel_h[grid](
         k=k,
@@ -313,7 +314,6 @@ def chunk_gated_delta_rule_fwd_h(
         BT=BT,
         BC=BC,
         BK=BK,
-        BV=BV,
         NT=NT,
         HEAD_FIRST=head_first
     )
@@ -351,17 +351,11 @@ def chunk_gated_delta_rule_bwd_dhu(
     assert BK <= 256, "current kernel does not support head dimension being larger than 256."
     # H100
     if torch.cuda.get_device_capability()[0] >= 9:
-        BV = 64
         BC = 64
-    # A100
-    elif torch.cuda.get_device_capability() == (8, 0):
-        BV = 32
-        BC = 64 if K <= 128 else 32
     else:
-        BV = 32
         BC = 64 if K <= 128 else 32
     BC = min(BT, BC)
-    NK, NV = triton.cdiv(K, BK), triton.cdiv(V, BV)
+    NK = triton.cdiv(K, BK)
     assert NK == 1, 'NK > 1 is not supported because it involves time-consuming synchronization'
 
     if head_first:
@@ -371,7 +365,9 @@ def chunk_gated_delta_rule_bwd_dhu(
     dh0 = torch.empty_like(h0, dtype=torch.float32) if h0 is not None else None
     dv2 = torch.empty_like(dv)
 
-    grid = (NK, NV, N * H)
+    def grid(meta):
+        return (NK, triton.cdiv(V, meta['BV']), N * H)
+
     chunk_gated_delta_rule_bwd_kernel_dhu[grid](
         q=q,
         k=k,
@@ -393,7 +389,6 @@ def chunk_gated_delta_rule_bwd_dhu(
         BT=BT,
         BC=BC,
         BK=BK,
-        BV=BV,
         HEAD_FIRST=head_first
     )
     return dh, dh0, dv2
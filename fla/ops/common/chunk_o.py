@@ -119,7 +119,7 @@ def chunk_fwd_kernel_o(
     configs=[
         triton.Config({}, num_warps=num_warps, num_stages=num_stages)
         for num_warps in [2, 4, 8]
-        for num_stages in [2, 3]
+        for num_stages in [2, 3, 4]
     ],
     key=["BT", "BK", "BV", "USE_G", "USE_DW"],
 )
@@ -205,6 +205,10 @@ def chunk_bwd_kernel_dqkwg(
         # [BV, BK]
         b_h = tl.load(p_h, boundary_check=(0, 1))
         b_dh = tl.load(p_dh, boundary_check=(0, 1))
+        # issue all loads before any dot so that the pipeliner can prefetch the next V block
+        if USE_DW:
+            p_dv = tl.make_block_ptr(dv, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
+            b_dv = tl.load(p_dv, boundary_check=(0, 1))
         if USE_G:
             b_dg_last += (tl.sum(b_h * b_dh))
         # [BT, BV] @ [BV, BT] -> [BT, BT]
@@ -214,13 +218,12 @@ def chunk_bwd_kernel_dqkwg(
         # [BT, BV] @ [BV, BK] -> [BT, BK]
         b_dk += tl.dot(b_v, b_dh.to(b_v.dtype))
         if USE_DW:
-            p_dv = tl.make_block_ptr(dv, (T, V), (s_vo, 1), (i_t * BT, i_v * BV), (BT, BV), (1, 0))
-            b_dv = tl.load(p_dv, boundary_check=(0, 1))
-            b_dw += tl.dot(b_dv.to(b_v.dtype), b_h.to(b_v.dtype))
+            # accumulate the negated gradient directly so that no negation is needed before the store
+            b_dw -= tl.dot(b_dv.to(b_v.dtype), b_h.to(b_v.dtype))
 
     if USE_DW and not USE_G:
         p_dw = tl.make_block_ptr(dw, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
-        tl.store(p_dw, -b_dw.to(p_dw.dtype.element_ty), boundary_check=(0, 1))
+        tl.store(p_dw, b_dw.to(p_dw.dtype.element_ty), boundary_check=(0, 1))
 
     tl.debug_barrier()
     o_i = tl.arange(0, BT)
@@ -246,8 +249,8 @@ def chunk_bwd_kernel_dqkwg(
             p_dw = tl.make_block_ptr(dw, (T, K), (s_qk, 1), (i_t * BT, i_k * BK), (BT, BK), (1, 0))
             b_w = tl.load(p_w, boundary_check=(0, 1))
             b_dw = b_dw * tl.exp(b_g)[:, None]
-            tl.store(p_dw, -b_dw.to(p_dw.dtype.element_ty), boundary_check=(0, 1))
-            b_dg -= tl.sum(b_w * b_dw, axis=1)
+            tl.store(p_dw, b_dw.to(p_dw.dtype.element_ty), boundary_check=(0, 1))
+            b_dg += tl.sum(b_w * b_dw, axis=1)
 
         b_dq = b_dq * tl.exp(b_g)[:, None] * scale
         b_dg += tl.sum(b_dq * b_q, axis=1)
@@ -645,5 +648,6 @@ def chunk_bwd_dqkwg(
     )
 
     if dg is not None:
-        dg = dg.sum(0)
+        # a single key block needs no reduction, the leading dim can be dropped without a copy
+        dg = dg.sum(0) if NK > 1 else dg[0]
     return dq, dk, dw, dg
@@ -229,7 +229,7 @@ class ChunkDeltaRuleFunction(torch.autograd.Function):
         ctx.indices = indices
         ctx.head_first = head_first
         ctx.use_qk_l2norm_in_kernel = use_qk_l2norm_in_kernel
-        return o.to(q.dtype), final_state
+        return o, final_state
 
     @staticmethod
     @contiguous
@@ -263,7 +263,7 @@ class ChunkDeltaRuleFunction(torch.autograd.Function):
         if use_qk_l2norm_in_kernel:
             dq = l2norm_bwd(q_orig, dq)
             dk = l2norm_bwd(k_orig, dk)
-        return dq.to(q.dtype), dk.to(k.dtype), dv.to(v.dtype), db.to(beta.dtype), None, dh0, None, None, None, None, None, None
+        return dq, dk, dv, db, None, dh0, None, None, None, None, None, None
 
 
 def chunk_delta_rule(
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2024, Songlin Yang, Yu Zhang
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -614,8 +614,11 @@ def fused_chunk_gla(
     scale: int = -1,
     initial_state: torch.Tensor = None,
     output_final_state: bool = False,
+    cu_seqlens: Optional[torch.LongTensor] = None,
     head_first: bool = True
 ) -> Tuple[torch.Tensor, torch.Tensor]:
+    if cu_seqlens is not None:
+        raise NotImplementedError("Variable-length inputs are not supported by `fused_chunk_gla`, use `chunk_gla` instead.")
     if scale == -1:
         scale = q.shape[-1] ** -0.5
     if not head_first:
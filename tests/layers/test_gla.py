@@ -20,14 +20,11 @@ def test_gla(
 ):
     naive = GatedLinearAttention(hidden_size=H, gate_fn=activation, fuse_norm=False).to(dtype).cuda()
     fused = GatedLinearAttention(hidden_size=H, gate_fn=activation, fuse_norm=True).to(dtype).cuda()
-    fused.q_proj.weight.data.copy_(naive.q_proj.weight.data)
-    fused.k_proj.weight.data.copy_(naive.k_proj.weight.data)
-    fused.v_proj.weight.data.copy_(naive.v_proj.weight.data)
+    fused.qkvg_proj.weight.data.copy_(naive.qkvg_proj.weight.data)
     fused.g_proj.weight.data.copy_(naive.g_proj.weight.data)
     fused.o_proj.weight.data.copy_(naive.o_proj.weight.data)
-    fused.gk_proj[0].weight.data.copy_(naive.gk_proj[0].weight.data)
-    fused.gk_proj[1].weight.data.copy_(naive.gk_proj[1].weight.data)
-    fused.gk_proj[1].bias.data.copy_(naive.gk_proj[1].bias.data)
+    fused.gk_up.weight.data.copy_(naive.gk_up.weight.data)
+    fused.gk_up.bias.data.copy_(naive.gk_up.bias.data)
 
     x = torch.randn(B, T, H, dtype=dtype).cuda()
     naive_x = x.clone().requires_grad_(True)
@@ -38,3 +35,33 @@ def test_gla(
     fused_o.sum().backward()
     assert naive_o.allclose(fused_o, 0, 1e-2)
     assert naive_x.grad.allclose(fused_x.grad, 0, 1e-2)
+
+
+@pytest.mark.parametrize("H", [256])
+@pytest.mark.parametrize("num_kv_heads", [None, 2])
+def test_gla_load_hook(
+    H: int,
+    num_kv_heads: int
+):
+    old = GatedLinearAttention(hidden_size=H, num_heads=4, num_kv_heads=num_kv_heads)
+    new = GatedLinearAttention(hidden_size=H, num_heads=4, num_kv_heads=num_kv_heads)
+    # rebuild a checkpoint in the legacy layout with separate projections
+    state_dict = {k: v for k, v in old.state_dict().items() if not k.startswith(('qkvg_proj', 'gk_up'))}
+    q, k, v, gk = old.qkvg_proj.weight.split(old.qkvg_dims)
+    state_dict.update({
+        'q_proj.weight': q.clone(),
+        'k_proj.weight': k.clone(),
+        'v_proj.weight': v.clone(),
+        'gk_proj.0.weight': gk.clone(),
+        'gk_proj.1.weight': old.gk_up.weight.clone(),
+        'gk_proj.1.bias': old.gk_up.bias.clone()
+    })
+    # a checkpoint with only some of the legacy projections must not load silently
+    partial = {k: v for k, v in state_dict.items() if k != 'v_proj.weight'}
+    with pytest.raises(ValueError):
+        new.load_state_dict(partial)
+
+    new.load_state_dict(state_dict)
+    assert new.qkvg_proj.weight.equal(old.qkvg_proj.weight)
+    assert new.gk_up.weight.equal(old.gk_up.weight)
+    assert new.gk_up.bias.equal(old.gk_up.bias)
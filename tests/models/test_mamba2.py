@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import torch
+
+from fla.models.mamba2.configuration_mamba2 import Mamba2Config
+from fla.models.mamba2.modeling_mamba2 import Mamba2Mixer
+
+
+def get_err_ratio(x, y):
+    err = (x - y).flatten().square().mean().sqrt().item()
+    base = x.flatten().square().mean().sqrt().item()
+    return err / base
+
+
+@pytest.mark.parametrize("B", [2])
+@pytest.mark.parametrize("T", [100, 300])
+@pytest.mark.parametrize("H", [4])
+@pytest.mark.parametrize("n_groups", [1, 2])
+@pytest.mark.parametrize("dtype", [torch.bfloat16])
+def test_chunk_ssd(
+    B: int,
+    T: int,
+    H: int,
+    n_groups: int,
+    dtype: torch.dtype
+):
+    torch.manual_seed(42)
+    config = Mamba2Config(
+        num_heads=H,
+        head_dim=64,
+        hidden_size=128,
+        state_size=64,
+        expand=2,
+        n_groups=n_groups,
+        chunk_size=64
+    )
+    mixer = Mamba2Mixer(config, layer_idx=0).cuda()
+    P, N = config.head_dim, config.state_size
+
+    x = torch.randn(B, T, H, P, dtype=dtype).cuda()
+    # distinct groups, expanded to heads the same way as in `Mamba2Mixer.torch_forward`
+    b = torch.randn(B, T, n_groups, N, dtype=dtype).cuda().repeat_interleave(H // n_groups, 2)
+    c = torch.randn(B, T, n_groups, N, dtype=dtype).cuda().repeat_interleave(H // n_groups, 2)
+    # shifted so that softplus(dt + dt_bias) falls into the typical range of Mamba2 step sizes
+    dt = (torch.randn(B, T, H) - 4).to(dtype).cuda()
+    A = -torch.exp(mixer.A_log.float())
+
+    ref, ref_ht = mixer.naive_ssd(x, b, c, dt, A, output_final_state=True)
+    tri, tri_ht = mixer.chunk_ssd(x, b, c, dt, A, output_final_state=True)
+    assert tri.shape == ref.shape and tri_ht.shape == ref_ht.shape == (B, H, P, N)
+    assert get_err_ratio(ref, tri.float()) < 5e-3
+    assert get_err_ratio(ref_ht, tri_ht.float()) < 5e-3
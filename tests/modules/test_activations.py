@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from fla.modules.activations import logsigmoid
+
+
+@pytest.mark.parametrize("B", [1, 4])
+@pytest.mark.parametrize("T", [1, 50, 2048])
+@pytest.mark.parametrize("D", [50, 64, 128])
+@pytest.mark.parametrize("temperature", [1., 4., 16.])
+@pytest.mark.parametrize("clamp_min", [None, -5.])
+def test_logsigmoid(B: int, T: int, D: int, temperature: float, clamp_min: Optional[float]):
+    # scale the inputs so that a fair share of the elements fall below `clamp_min`
+    x = (torch.randn(B, T, D) * 8).cuda().requires_grad_(True)
+
+    ref_y = F.logsigmoid(x) / temperature
+    if clamp_min is not None:
+        ref_y = torch.clamp_min(ref_y, clamp_min)
+    ref_dx = torch.autograd.grad(ref_y.sum(), x)[0]
+
+    tri_y = logsigmoid(x, temperature, clamp_min)
+    tri_dx = torch.autograd.grad(tri_y.sum(), x)[0]
+
+    torch.testing.assert_close(ref_y, tri_y, rtol=0, atol=1e-4)
+    torch.testing.assert_close(ref_dx, tri_dx, rtol=0, atol=1e-4)